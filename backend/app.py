@@ -1,21 +1,52 @@
 # backend/app.py (updated with chatbot integration)
-import math, json, pathlib
+import math, json, pathlib, functools, re, hashlib, time, mmap
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+import numpy as np
 from rapidfuzz import process, fuzz  # pip install rapidfuzz
+from rapidfuzz.utils import default_process
 import sys, os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from dotenv import load_dotenv
 from flask import Flask, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-from schemas import PredictRequest, PredictResponse
+from schemas import PredictRequest
 from utils import average, decision_label, recommendations
 
 from models import UnimatchDummyModel
 from llm_scorer import LLMScorer
 from chatbot import EducationChatbot
 
+# Optional: orjson (faster KB parsing + JSON responses); stdlib json works as a fallback
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore
+
+_json_loads = orjson.loads if orjson else json.loads
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson, so every jsonify() uses it."""
+
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY  # numpy scalars, as stdlib json did for float64
+        if kwargs.get("sort_keys", self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get("indent"):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=kwargs.get("default", self.default), option=option).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 load_dotenv()
 
 app = Flask(__name__)
+if orjson is not None:
+    app.json = OrjsonProvider(app)
 CORS(app)
 
 # -------------------------------------------------------
@@ -38,6 +69,19 @@ chatbot = EducationChatbot(
     student_data_path=str(STUDENT_DATA_PATH) if STUDENT_DATA_PATH.exists() else None
 )
 
+def _json_dumps(payload) -> bytes:
+    """Compact, key-sorted JSON bytes (same shape as jsonify)."""
+    if orjson is None:
+        return json.dumps(payload, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
+
+def _kb_response(body: bytes, index):
+    """KB data only changes with majors.json: tag it, and answer If-None-Match with 304."""
+    resp = app.response_class(body, mimetype="application/json")
+    resp.set_etag(index.etag)
+    resp.headers["Cache-Control"] = "public, max-age=300"
+    return resp.make_conditional(request)
+
 # -------------------------------------------------------
 # Health / KB APIs
 # -------------------------------------------------------
@@ -125,82 +169,173 @@ def get_subject_topics(program, subject):
 @app.get("/api/kb/universities")
 def kb_universities():
     """Return unique university names."""
-    def _load():
-        if llm and getattr(llm, "kb", None) and llm.kb.majors:
-            return llm.kb.majors
-        p = pathlib.Path(__file__).resolve().parents[1] / "kb" / "majors.json"
-        if p.exists():
-            with open(p, "r", encoding="utf-8") as f:
-                return json.load(f)
-        return {}
-    
-    majors = _load()
-    universities = sorted({ (v.get("university") or "").strip() for v in majors.values() if v.get("university") })
-    return jsonify({"universities": universities, "count": len(universities)})
+    index = _kb_index(_load_kb_majors(llm))
+    return _kb_response(index.body_universities, index)
 
 @app.get("/api/kb/majors")
 def kb_majors():
     """Return unique major names (untuk multi-select)."""
-    def _load():
-        if llm and getattr(llm, "kb", None) and llm.kb.majors:
-            return llm.kb.majors
-        p = pathlib.Path(__file__).resolve().parents[1] / "kb" / "majors.json"
-        if p.exists():
-            with open(p, "r", encoding="utf-8") as f:
-                return json.load(f)
-        return {}
-    majors = _load()
-    names = sorted({ (v.get("major") or "").strip() for v in majors.values() if v.get("major") })
-    return jsonify({"majors": names, "count": len(names)})
+    index = _kb_index(_load_kb_majors(llm))
+    return _kb_response(index.body_majors, index)
 
 @app.get("/api/kb/universities/<university_name>/majors")
 def kb_university_majors(university_name):
     """Return majors available at a specific university."""
-    def _load():
-        if llm and getattr(llm, "kb", None) and llm.kb.majors:
-            return llm.kb.majors
-        p = pathlib.Path(__file__).resolve().parents[1] / "kb" / "majors.json"
-        if p.exists():
-            with open(p, "r", encoding="utf-8") as f:
-                return json.load(f)
-        return {}
-    
-    majors = _load()
-    university_majors = []
-    
-    for key, value in majors.items():
-        if value.get("university") and value.get("major"):
-            # Case-insensitive comparison
-            if value["university"].lower() == university_name.lower():
-                university_majors.append(value["major"])
-    
-    # Remove duplicates and sort
-    university_majors = sorted(list(set(university_majors)))
-    
-    return jsonify({
-        "university": university_name,
-        "majors": university_majors, 
-        "count": len(university_majors)
-    })
+    index = _kb_index(_load_kb_majors(llm))
+    body = index.body_university_majors.get(university_name)
+    if body is None:
+        # Not spelled exactly as in the KB: case-insensitive lookup, serialized per request
+        body = _json_dumps(_university_majors_payload(university_name, index.majors_by_university))
+    return _kb_response(body, index)
 
 # -------------------------------------------------------
 # Helpers (recommender)
 # -------------------------------------------------------
+@functools.lru_cache(maxsize=1)
+def _majors_cached(mtime: float) -> dict:
+    """Parse majors.json once per file version (keyed by mtime)."""
+    with open(MAJORS_KB_PATH, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return _json_loads(b"")  # mmap can't map an empty file; keep the parser's error
+        # Parse straight from the page cache (orjson reads the buffer, no bytes copy)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if orjson:
+                try:
+                    with memoryview(mm) as view:
+                        return orjson.loads(view)
+                except orjson.JSONDecodeError:
+                    pass  # e.g. NaN tokens (build_kb.py json.dump) -> stdlib json accepts them
+            return json.loads(mm[:])
+
+KB_STAT_INTERVAL = 2.0  # seconds between majors.json mtime checks
+_kb_stat = {"checked_at": float("-inf"), "mtime": None}
+
+def _load_kb_file() -> dict:
+    # Re-stat at most every KB_STAT_INTERVAL; the (missing-)file state is cached in between
+    now = time.monotonic()
+    if now - _kb_stat["checked_at"] >= KB_STAT_INTERVAL:
+        try:
+            mtime = os.stat(MAJORS_KB_PATH).st_mtime
+        except OSError:
+            mtime = None
+        _kb_stat.update(checked_at=now, mtime=mtime)
+    mtime = _kb_stat["mtime"]  # read once: another thread may update it concurrently
+    if mtime is None:
+        return {}
+    return _majors_cached(mtime)
+
 def _load_kb_majors(llm_obj):
     if llm_obj and getattr(llm_obj, "kb", None) and llm_obj.kb.majors:
         return llm_obj.kb.majors
-    kb_path = (pathlib.Path(__file__).resolve().parents[1] / "kb" / "majors.json")
-    if kb_path.exists():
-        with open(kb_path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {}
+    return _load_kb_file()
+
+@dataclass(frozen=True)
+class MatchTables:
+    """KB names prepared for fuzzy matching (choices already run through default_process)."""
+    exact: Dict[Tuple[str, str], str]   # (casefold(university), casefold(major)) -> first key
+    uni_fold: List[str]                 # casefold(university), in KB order
+    uni_norm: List[str]                 # same universities, default_process'd
+    major_norm: List[str]               # every major name across universities
+    major_cols: Dict[str, List[int]]    # casefold(university) -> its columns in major_norm
+    major_keys: Dict[str, List[str]]    # casefold(university) -> KB key for each of those columns
+
+def _build_match_tables(majors_kb: dict) -> MatchTables:
+    fold = lambda s: sys.intern(s.casefold())
+    exact = {}
+    uni_names = {}
+    uni_majors = {}
+    for key, card in majors_kb.items():
+        uni = card.get("university") or ""
+        major = card.get("major") or ""
+        exact.setdefault((fold(uni), fold(major)), key)
+        if uni:
+            uni_names.setdefault(uni)
+            if major:
+                uni_majors.setdefault(fold(uni), {}).setdefault(major)
+
+    major_names = list({m: None for names in uni_majors.values() for m in names})
+    col = {m: j for j, m in enumerate(major_names)}
+    return MatchTables(
+        exact=exact,
+        uni_fold=[fold(u) for u in uni_names],
+        uni_norm=[default_process(u) for u in uni_names],
+        major_norm=[default_process(m) for m in major_names],
+        major_cols={u: [col[m] for m in names] for u, names in uni_majors.items()},
+        major_keys={u: [exact[(u, fold(m))] for m in names] for u, names in uni_majors.items()},
+    )
+
+@dataclass(frozen=True)
+class KBIndex:
+    """Lookups derived from a majors KB; rebuilt only when the KB changes."""
+    majors_by_university: Dict[str, List[str]]  # lower(university) -> sorted majors
+    pool_by_program: Dict[str, List[Tuple[str, dict]]]  # program -> candidate (key, card), in KB order
+    pool_scoring: Dict[str, "PoolScoring"]
+    pool_match: Dict[str, MatchTables]        # program -> match tables restricted to its pool
+    pool_keys: Dict[str, Tuple[List[str], List[str]]]  # program -> (pool keys, default_process'd), for major-only matching
+    match: MatchTables
+    # /api/kb/* response bodies, serialized once per KB
+    body_universities: bytes
+    body_majors: bytes
+    body_majors_full: bytes
+    body_university_majors: Dict[str, bytes]  # university name as in the KB -> body
+    etag: str                                 # content hash, for HTTP caching of /api/kb/*
+
+def _university_majors_payload(university_name, majors_by_university):
+    majors = majors_by_university.get(university_name.lower(), [])
+    return {"university": university_name, "majors": majors, "count": len(majors)}
+
+def _build_indexes(majors_kb: dict) -> KBIndex:
+    by_uni = {}
+    for value in majors_kb.values():
+        if value.get("university") and value.get("major"):
+            by_uni.setdefault(value["university"].lower(), set()).add(value["major"])
+    prog_by_key = {k: _guess_program_from_major(v.get("major","")) for k, v in majors_kb.items()}
+    pools = {
+        prog: [(k, v) for k, v in majors_kb.items() if prog_by_key[k] in {"unknown", prog}]
+        for prog in ("saintek", "soshum")
+    }
+    universities = sorted({ (v.get("university") or "").strip() for v in majors_kb.values() if v.get("university") })
+    majors = sorted({ (v.get("major") or "").strip() for v in majors_kb.values() if v.get("major") })
+    majors_by_university = {u: sorted(m) for u, m in by_uni.items()}
+    uni_names = set(universities) | {v["university"] for v in majors_kb.values() if v.get("university")}
+    body_majors_full = _json_dumps({"majors": majors, "details": majors_kb, "count": len(majors)})
+    return KBIndex(
+        majors_by_university=majors_by_university,
+        pool_by_program=pools,
+        pool_scoring={prog: _build_pool_scoring(pool) for prog, pool in pools.items()},
+        pool_match={prog: _build_match_tables(dict(pool)) for prog, pool in pools.items()},
+        pool_keys={prog: ([k for k, _ in pool], [default_process(k) for k, _ in pool]) for prog, pool in pools.items()},
+        match=_build_match_tables(majors_kb),
+        body_universities=_json_dumps({"universities": universities, "count": len(universities)}),
+        body_majors=_json_dumps({"majors": majors, "count": len(majors)}),
+        body_majors_full=body_majors_full,
+        body_university_majors={
+            u: _json_dumps(_university_majors_payload(u, majors_by_university)) for u in uni_names
+        },
+        etag=hashlib.md5(body_majors_full, usedforsecurity=False).hexdigest(),
+    )
+
+_kb_index_cache = (None, None)  # (kb, index): one assignment, so threads never see a mismatched pair
+
+def _kb_index(majors_kb: dict) -> KBIndex:
+    """Indexes for `majors_kb`, cached for as long as the same KB object is in use."""
+    global _kb_index_cache
+    kb, index = _kb_index_cache
+    if kb is not majors_kb:
+        index = _build_indexes(majors_kb)
+        _kb_index_cache = (majors_kb, index)
+    return index
+
+_SAINTEK_KW = frozenset(("fisika","kimia","biologi","kedokteran","informatika","statistika","elektro","mesin","teknik","matematika","farmasi","geologi","perikanan","arsitektur","kehutanan","pertanian"))
+_SOSHUM_KW  = frozenset(("hukum","ekonomi","manajemen","akuntansi","psikologi","sosiologi","sejarah","ilmu","komunikasi","bahasa","pendidikan","administrasi","hubungan","politik","pariwisata","bisnis"))
+# Keywords also count inside words ("GEOFISIKA", "(PERIKANAN)"): one compiled substring scan per program
+_SAINTEK_RE = re.compile("|".join(map(re.escape, sorted(_SAINTEK_KW))))
+_SOSHUM_RE  = re.compile("|".join(map(re.escape, sorted(_SOSHUM_KW))))
 
 def _guess_program_from_major(name: str) -> str:
     s = (name or "").lower()
-    saintek_kw = ["fisika","kimia","biologi","kedokteran","informatika","statistika","elektro","mesin","teknik","matematika","farmasi","geologi","perikanan","arsitektur","kehutanan","pertanian"]
-    soshum_kw  = ["hukum","ekonomi","manajemen","akuntansi","psikologi","sosiologi","sejarah","ilmu","komunikasi","bahasa","pendidikan","administrasi","hubungan","politik","pariwisata","bisnis"]
-    if any(k in s for k in saintek_kw): return "saintek"
-    if any(k in s for k in soshum_kw):  return "soshum"
+    if _SAINTEK_RE.search(s): return "saintek"
+    if _SOSHUM_RE.search(s):  return "soshum"
     return "unknown"
 
 def _bucket_from_prob(p: float) -> str:
@@ -208,8 +343,12 @@ def _bucket_from_prob(p: float) -> str:
     if p >= 0.40: return "target"
     return "reach"
 
-def _score_components(features, card):
-    """Hitung probabilitas + komponen + tags penjelas."""
+_ACH_BONUS = {"none":0,"school":1,"prov":3,"national":5}
+_AKR_ADJ   = {"A":1,"B":0,"C":-1}
+_COMP_PEN  = {"very":5,"high":3,"mid":1,"low":0}
+
+def _student_terms(features):
+    """Bagian skor yang hanya bergantung pada siswa (sama untuk semua prodi)."""
     rapor = float(features.get("rapor_avg", 0))
     core  = float(features.get("core_avg", rapor))
     rank  = int(features.get("rank_percentile", 100)) if features.get("rank_percentile") is not None else 100
@@ -217,16 +356,29 @@ def _score_components(features, card):
     akr   = str(features.get("accreditation", "B")).upper()
 
     rank_bonus = 3 if rank <= 10 else 2 if rank <= 20 else 1 if rank <= 40 else 0
-    ach_bonus  = {"none":0,"school":1,"prov":3,"national":5}.get(ach,0)
-    akr_adj    = {"A":1,"B":0,"C":-1}.get(akr,0)
+    ach_bonus  = _ACH_BONUS.get(ach,0)
+    akr_adj    = _AKR_ADJ.get(akr,0)
+    base = 0.6*rapor + 0.4*core
+    return rank, ach, akr, base, rank_bonus, ach_bonus, akr_adj
+
+def _has_ci(card):
+    ci = card.get("ci")
+    return isinstance(ci,(int,float)) and math.isfinite(ci)  # NaN/inf (e.g. empty sheet column) = missing
 
+def _competitiveness_penalty(card, features):
     comp = (card.get("competitiveness") or features.get("competitiveness") or "high")
-    ci   = card.get("ci")
-    comp_pen = round(5*float(ci)) if isinstance(ci,(int,float)) else {"very":5,"high":3,"mid":1,"low":0}.get(str(comp).lower(),3)
+    return round(5*float(card["ci"])) if _has_ci(card) else _COMP_PEN.get(str(comp).lower(),3)
 
-    base = 0.6*rapor + 0.4*core
+def _score_kernel(base, rank_bonus, ach_bonus, akr_adj, comp_pen, exp=math.exp):
+    """Skor + probabilitas (logistic a=0.25, midpoint 75); comp_pen boleh np.ndarray dengan exp=np.exp."""
     score = base + rank_bonus + ach_bonus + akr_adj - comp_pen
-    prob  = 1/(1+math.exp(-0.25*(score-75)))
+    return score, 1/(1+exp(-0.25*(score-75)))
+
+def _score_components(features, card):
+    """Hitung probabilitas + komponen + tags penjelas."""
+    rank, ach, akr, base, rank_bonus, ach_bonus, akr_adj = _student_terms(features)
+    comp_pen = _competitiveness_penalty(card, features)
+    score, prob = _score_kernel(base, rank_bonus, ach_bonus, akr_adj, comp_pen)
 
     tags = []
     if rank <= 10: tags.append("Top-10% rank")
@@ -244,90 +396,135 @@ def _score_components(features, card):
     }
     return float(prob), components, tags
 
-def _top_per_university(items, per_uni=2):
-    """Ambil maksimum N prodi per universitas untuk diversity."""
-    by = {}
-    for it in items:
-        by.setdefault(it["university"], []).append(it)
+@dataclass(frozen=True)
+class PoolScoring:
+    """Per-card scoring inputs for one program pool, aligned with its (key, card) entries."""
+    comp_pen: np.ndarray    # competitiveness penalty; NaN where it falls back to the request's competitiveness
+    uni_codes: np.ndarray   # university of each row, as a small int
+    pos: Dict[str, int]     # KB key -> row
+
+def _codes(values) -> np.ndarray:
+    seen = {}
+    return np.array([seen.setdefault(v, len(seen)) for v in values], dtype=np.intp)
+
+def _build_pool_scoring(pool) -> PoolScoring:
+    pen = [
+        _competitiveness_penalty(card, {})
+        if _has_ci(card) or card.get("competitiveness") else np.nan
+        for _, card in pool
+    ]
+    return PoolScoring(
+        comp_pen=np.array(pen, dtype=np.float64),
+        uni_codes=_codes([card.get("university") for _, card in pool]),
+        pos={key: i for i, (key, _) in enumerate(pool)},
+    )
+
+def _pool_probabilities(features, scoring: PoolScoring) -> np.ndarray:
+    """Probabilitas _score_components untuk seluruh pool sekaligus (vectorized)."""
+    _, _, _, base, rank_bonus, ach_bonus, akr_adj = _student_terms(features)
+    pen = np.where(np.isnan(scoring.comp_pen), _competitiveness_penalty({}, features), scoring.comp_pen)
+    return _score_kernel(base, rank_bonus, ach_bonus, akr_adj, pen, exp=np.exp)[1]
+
+def _top_per_university(items, per_uni=2, university=lambda it: it["university"], n=None):
+    """Ambil maksimum N prodi per universitas untuk diversity, satu pass atas items yang sudah terurut desc."""
+    count = Counter()
     out = []
-    for uni, lst in by.items():
-        lst.sort(key=lambda x: x["probability"], reverse=True)
-        out.extend(lst[:per_uni])
+    for it in items:
+        u = university(it)
+        if count[u] < per_uni:
+            count[u] += 1
+            out.append(it)
+            if len(out) == n:
+                break
     return out
 
+def _top_rows_per_university(probs, rows, uni_codes, n, per_uni=2):
+    """
+    `_top_per_university` atas `rows` yang diurutkan by probability, dipotong n.
+    Hanya "kepala" ranking yang diurutkan (np.partition); kepala diperbesar
+    jika belum menghasilkan n item.
+    """
+    def _top(idx):
+        idx = idx[np.argsort(-probs[idx], kind="stable")]
+        return _top_per_university(idx, per_uni=per_uni, university=lambda i: uni_codes[i], n=n)
+
+    if n <= 0:
+        return []
+    p = probs[rows]
+    k = 8 * n
+    while k < len(rows):
+        # Semua row dengan prob >= nilai ke-k: prefix persis dari urutan stable sort
+        kth = np.partition(p, len(p) - k)[len(p) - k]
+        out = _top(rows[p >= kth])
+        if len(out) == n:
+            return out
+        k *= 2
+    return _top(rows)
+
+def _find_best_matches_for_pairs(majors_kb, pairs, tables=None):
+    """
+    Find the best matching KB entry for each (university, major) pair.
+    Fuzzy scores for all pairs are computed in one `cdist` call per field;
+    pass prebuilt `tables` for `majors_kb` to skip preparing the KB names.
+    Returns a list aligned with `pairs` of (key, card), or (None, None) if no good match found.
+    """
+    t = tables or _build_match_tables(majors_kb)
+    results = [(None, None)] * len(pairs)
+
+    # First, try exact match
+    pending = []
+    for i, (target_university, target_major) in enumerate(pairs):
+        if not target_university or not target_major:
+            continue
+        key = t.exact.get((target_university.casefold(), target_major.casefold()))
+        if key is not None:
+            results[i] = (key, majors_kb[key])
+        else:
+            pending.append(i)
+
+    if not pending or not t.uni_fold:
+        return results
+
+    # If no exact match, fuzzy match university first, then major within that university
+    uni_scores = process.cdist([default_process(pairs[i][0]) for i in pending], t.uni_norm,
+                               scorer=fuzz.WRatio, processor=None, score_cutoff=70, workers=-1)  # 70% similarity threshold
+    major_scores = process.cdist([default_process(pairs[i][1]) for i in pending], t.major_norm,
+                                 scorer=fuzz.WRatio, processor=None, score_cutoff=70, workers=-1)
+
+    for row, i in enumerate(pending):
+        u = int(np.argmax(uni_scores[row]))
+        if uni_scores[row, u] < 70:
+            continue
+        matched_uni = t.uni_fold[u]
+
+        cols = t.major_cols.get(matched_uni)
+        if not cols:
+            continue
+        cand = major_scores[row, cols]
+        m = int(np.argmax(cand))
+        if cand[m] < 70:
+            continue
+
+        key = t.major_keys[matched_uni][m]
+        results[i] = (key, majors_kb[key])
+
+    return results
+
 def _find_best_match_for_university_major_pair(majors_kb, target_university, target_major):
     """
     Find the best matching entry in KB for a given university-major pair.
     Returns the key and card data, or (None, None) if no good match found.
     """
-    if not target_university or not target_major:
-        return None, None
-    
-    # First, try exact match
-    for key, card in majors_kb.items():
-        if (card.get("university", "").lower() == target_university.lower() and 
-            card.get("major", "").lower() == target_major.lower()):
-            return key, card
-    
-    # If no exact match, try fuzzy matching on university first
-    university_matches = []
-    for key, card in majors_kb.items():
-        if card.get("university"):
-            university_matches.append((key, card["university"]))
-    
-    if university_matches:
-        uni_keys = [k for k, _ in university_matches]
-        uni_names = [u for _, u in university_matches]
-        
-        # Fuzzy match university
-        uni_result = process.extractOne(target_university, uni_names, scorer=fuzz.WRatio)
-        if uni_result and uni_result[1] >= 70:  # 70% similarity threshold
-            matched_uni_name = uni_result[0]
-            
-            # Now find majors in that university
-            uni_majors = []
-            for key, card in majors_kb.items():
-                if card.get("university", "").lower() == matched_uni_name.lower():
-                    if card.get("major"):
-                        uni_majors.append((key, card["major"]))
-            
-            if uni_majors:
-                major_keys = [k for k, _ in uni_majors]
-                major_names = [m for _, m in uni_majors]
-                
-                # Fuzzy match major within that university
-                major_result = process.extractOne(target_major, major_names, scorer=fuzz.WRatio)
-                if major_result and major_result[1] >= 70:  # 70% similarity threshold
-                    matched_major_name = major_result[0]
-                    
-                    # Find the exact entry
-                    for key, card in majors_kb.items():
-                        if (card.get("university", "").lower() == matched_uni_name.lower() and 
-                            card.get("major", "").lower() == matched_major_name.lower()):
-                            return key, card
-    
-    return None, None
+    tables = _kb_index(majors_kb).match
+    return _find_best_matches_for_pairs(majors_kb, [(target_university, target_major)], tables)[0]
 
 # -------------------------------------------------------
 # Predict
 # -------------------------------------------------------
-@app.post("/api/predict")
-def predict():
-    try:
-        raw = request.get_json(force=True, silent=False)
-        
-        # Handle both old and new payload formats
-        # Priority: target_university_1 + target_major_1 > target_major (legacy)
-        if raw.get("target_university_1") and raw.get("target_major_1"):
-            raw["target_university"] = raw["target_university_1"]
-            raw["target_major"] = raw["target_major_1"]
-        elif not raw.get("target_major") and isinstance(raw.get("target_majors"), list) and raw["target_majors"]:
-            raw["target_major"] = raw["target_majors"][0]
-            
-        req = PredictRequest(**raw)
-    except Exception as e:
-        return jsonify({"error": f"Invalid payload: {e}"}), 400
+_llm_executor = ThreadPoolExecutor(max_workers=16)  # concurrent LLM calls for /api/predict/batch
+MAX_BATCH_TARGETS = 16  # per /api/predict/batch request: bounds LLM calls (cost, executor share) and cdist size
 
+def _features_from_request(req: PredictRequest) -> dict:
     rapor_avg = average([req.s1, req.s2, req.s3, req.s4, req.s5]) or 0.0
     if req.program == "saintek":
         core_avg = average([req.math, req.language, req.physics, req.chemistry, req.biology])
@@ -335,7 +532,7 @@ def predict():
         core_avg = average([req.math, req.language, req.economics, req.geography, req.history])
     core_avg = core_avg if core_avg is not None else rapor_avg
 
-    features = {
+    return {
         "program": req.program,
         "target_major": req.target_major,
         "target_university": getattr(req, 'target_university', None),
@@ -347,6 +544,62 @@ def predict():
         "accreditation": req.accreditation,
     }
 
+def _llm_target(matched_card, target_major):
+    if matched_card:
+        # Use the specific university-major combination
+        return f"{matched_card.get('university', '')} - {matched_card.get('major', '')}"
+    # Fallback to major-only scoring
+    return target_major or "Unknown"
+
+def _llm_prediction(features, result, matched_card):
+    prob = float(result.get("probability", 0.0))
+    label = decision_label(prob)
+    details = {
+        **features,
+        "probability_raw": result.get("probability_raw"),
+        "program_match": result.get("program_match"),
+        "matched_university_major": f"{matched_card.get('university', 'N/A')} - {matched_card.get('major', 'N/A')}" if matched_card else None,
+    }
+    tips = recommendations(prob, {
+        **features,
+        "competitiveness_penalty": _COMP_PEN[features["competitiveness"]]
+    })
+    return {
+        "probability": prob,
+        "label": label,
+        "details": details,
+        "tips": tips,
+        "weights": result.get("weights"),
+        "explanation": result.get("explanation", "")
+    }
+
+def _dummy_prediction(features, prob):
+    # Output milik server sendiri -> dict langsung (bentuk PredictResponse), tanpa validasi Pydantic
+    prob = float(prob)
+    label = decision_label(prob)
+    details = {**features, "probability": prob, "label": label}
+    tips = recommendations(prob, {**features, "competitiveness_penalty": _COMP_PEN[features["competitiveness"]]})
+    return {"probability": prob, "label": label, "details": details, "tips": tips}
+
+@app.post("/api/predict")
+def predict():
+    try:
+        raw = _json_loads(request.get_data())
+        
+        # Handle both old and new payload formats
+        # Priority: target_university_1 + target_major_1 > target_major (legacy)
+        if raw.get("target_university_1") and raw.get("target_major_1"):
+            raw["target_university"] = raw["target_university_1"]
+            raw["target_major"] = raw["target_major_1"]
+        elif not raw.get("target_major") and isinstance(raw.get("target_majors"), list) and raw["target_majors"]:
+            raw["target_major"] = raw["target_majors"][0]
+            
+        req = PredictRequest.model_validate(raw)
+    except Exception as e:
+        return jsonify({"error": f"Invalid payload: {e}"}), 400
+
+    features = _features_from_request(req)
+
     # Try to find specific university-major combination for better prediction
     target_university = getattr(req, 'target_university', None)
     target_major = req.target_major
@@ -357,42 +610,47 @@ def predict():
         matched_key, matched_card = _find_best_match_for_university_major_pair(
             majors_kb, target_university, target_major
         )
-        
-        if matched_card:
-            # Use the specific university-major combination
-            result = llm.score(features, f"{matched_card.get('university', '')} - {matched_card.get('major', '')}")
-        else:
-            # Fallback to major-only scoring
-            result = llm.score(features, req.target_major or "Unknown")
-            
-        prob = float(result.get("probability", 0.0))
-        label = decision_label(prob)
-        details = {
-            **features,
-            "probability_raw": result.get("probability_raw"),
-            "program_match": result.get("program_match"),
-            "matched_university_major": f"{matched_card.get('university', 'N/A')} - {matched_card.get('major', 'N/A')}" if matched_card else None,
-        }
-        tips = recommendations(prob, {
-            **features,
-            "competitiveness_penalty": {"very": 5, "high": 3, "mid": 1, "low": 0}[req.competitiveness]
-        })
-        return jsonify({
-            "probability": prob,
-            "label": label,
-            "details": details,
-            "tips": tips,
-            "weights": result.get("weights"),
-            "explanation": result.get("explanation", "")
-        })
+        result = llm.score(features, _llm_target(matched_card, req.target_major))
+        return jsonify(_llm_prediction(features, result, matched_card))
 
     # Dummy model fallback
-    prob = dummy.predict_proba(features)
-    label = decision_label(prob)
-    details = {**features, "probability": prob, "label": label}
-    tips = recommendations(prob, {**features, "competitiveness_penalty": {"very":5,"high":3,"mid":1,"low":0}[req.competitiveness]})
-    resp = PredictResponse(probability=prob, label=label, details=details, tips=tips)
-    return jsonify(resp.model_dump())
+    return jsonify(_dummy_prediction(features, dummy.predict_proba(features)))
+
+@app.post("/api/predict/batch")
+def predict_batch():
+    """
+    Payload: {"common": {...field /api/predict...}, "targets": [{"university": ..., "major": ...}, ...]}
+    Return:  list hasil /api/predict, urut sesuai targets
+    """
+    try:
+        raw = _json_loads(request.get_data())
+        targets = raw.get("targets")
+        if not isinstance(targets, list):
+            raise ValueError("targets must be a list")
+        if len(targets) > MAX_BATCH_TARGETS:
+            raise ValueError(f"at most {MAX_BATCH_TARGETS} targets per batch")
+        pairs = [(str(t.get("university") or "").strip() or None, str(t.get("major") or "").strip() or None)
+                 for t in targets]
+        req = PredictRequest.model_validate(raw.get("common") or {})
+    except Exception as e:
+        return jsonify({"error": f"Invalid payload: {e}"}), 400
+
+    common = _features_from_request(req)
+    features = [{**common, "target_major": major, "target_university": uni} for uni, major in pairs]
+
+    if llm and llm.client:
+        # Satu pass matching untuk semua target, lalu panggilan LLM paralel
+        majors_kb = _load_kb_majors(llm)
+        matches = _find_best_matches_for_pairs(majors_kb, pairs, _kb_index(majors_kb).match)
+        jobs = [(f, _llm_target(card, major)) for f, (_, card), (_, major) in zip(features, matches, pairs)]
+        results = _llm_executor.map(lambda job: llm.score(*job), jobs)
+        return jsonify([
+            _llm_prediction(f, result, card) for f, result, (_, card) in zip(features, results, matches)
+        ])
+
+    # Dummy model tidak bergantung pada target -> cukup dihitung sekali
+    prob = dummy.predict_proba(common)
+    return jsonify([_dummy_prediction(f, prob) for f in features])
 
 # -------------------------------------------------------
 # Recommend (multi-major) -> preferred + alternatives
@@ -404,7 +662,7 @@ def recommend():
     Query:   pref_n, alt_n, per_uni (default 10,10,2)
     """
     try:
-        raw = request.get_json(force=True, silent=False)
+        raw = _json_loads(request.get_data())
         
         # Handle university-major pairs
         target_universities = []
@@ -421,40 +679,20 @@ def recommend():
         if not raw.get("target_university") and target_universities:
             raw["target_university"] = target_universities[0]
             
-        req = PredictRequest(**raw)
+        req = PredictRequest.model_validate(raw)
     except Exception as e:
         return jsonify({"error": f"Invalid payload: {e}"}), 400
 
-    rapor_avg = average([req.s1, req.s2, req.s3, req.s4, req.s5]) or 0.0
-    if req.program == "saintek":
-        core_avg = average([req.math, req.language, req.physics, req.chemistry, req.biology])
-    else:
-        core_avg = average([req.math, req.language, req.economics, req.geography, req.history])
-    core_avg = core_avg if core_avg is not None else rapor_avg
-
-    feats = {
-        "program": req.program,
-        "target_major": req.target_major,
-        "target_university": getattr(req, 'target_university', None),
-        "competitiveness": req.competitiveness,
-        "rapor_avg": rapor_avg,
-        "core_avg": core_avg,
-        "rank_percentile": req.rank_percentile,
-        "achievement": req.achievement,
-        "accreditation": req.accreditation,
-    }
+    feats = _features_from_request(req)
 
     majors = _load_kb_majors(llm)
     if not majors:
         return jsonify({"error": "Knowledge base not found. Run build_kb.py first."}), 500
 
-    # Pool kandidat (filter kasar by program)
-    pool = []
-    for key, card in majors.items():
-        prog_guess = _guess_program_from_major(card.get("major",""))
-        if req.program in {"saintek","soshum"} and prog_guess not in {"unknown", req.program}:
-            continue
-        pool.append((key, card))
+    # Pool kandidat (filter kasar by program, precomputed per KB)
+    idx = _kb_index(majors)
+    pool = idx.pool_by_program[req.program]
+    scoring = idx.pool_scoring[req.program]
 
     # Fungsi untuk membuat item dengan skor & komponen
     def _item(key, card):
@@ -481,45 +719,43 @@ def recommend():
     if target_universities and target_majors:
         # Match pairs based on position (university[0] with major[0], etc.)
         pairs = list(zip(target_universities, target_majors))
-        keep = set()
-        
-        for target_uni, target_maj in pairs:
-            matched_key, matched_card = _find_best_match_for_university_major_pair(
-                dict(pool), target_uni, target_maj
-            )
-            if matched_key:
-                keep.add(matched_key)
+        matches = _find_best_matches_for_pairs(majors, pairs, idx.pool_match[req.program])
+        keep = {matched_key for matched_key, _ in matches if matched_key}
         
         preferred = [_item(k, majors[k]) for k in keep if k in majors]
     
     # Fallback to major-only matching if no university-major pairs matched
     if not preferred and target_majors:
-        keys = [k for k,_ in pool]
+        keys, keys_norm = idx.pool_keys[req.program]
         keep = set()
-        for query in target_majors:
-            for (match, score, _) in process.extract(query, keys, scorer=fuzz.WRatio, limit=80):
-                if score >= 80:
-                    keep.add(match)
+        scores = process.cdist([default_process(q) for q in target_majors], keys_norm,
+                               scorer=fuzz.WRatio, processor=None, score_cutoff=80, workers=-1)
+        for row in scores:
+            hits = np.flatnonzero(row >= 80)
+            if len(hits) > 80:  # max 80 matches per query
+                hits = hits[np.argsort(-row[hits], kind="stable")[:80]]
+            keep.update(keys[j] for j in hits)
         preferred = [_item(k, majors[k]) for k in keep]
 
-    # Others: selain preferred
-    pref_keys = {x["key"] for x in preferred}
-    others = [_item(k, c) for (k,c) in pool if k not in pref_keys]
+    per_uni = int(request.args.get("per_uni", 2))
+    pref_n = int(request.args.get("pref_n", 10))
+    alt_n  = int(request.args.get("alt_n", 10))
+
+    # Others: selain preferred. Skor seluruh pool dihitung sekaligus,
+    # item lengkap hanya dibuat untuk yang lolos cutoff.
+    probs = _pool_probabilities(feats, scoring)
+    is_other = np.ones(len(pool), dtype=bool)
+    is_other[[scoring.pos[x["key"]] for x in preferred if x["key"] in scoring.pos]] = False
+    picked = _top_rows_per_university(probs, np.flatnonzero(is_other), scoring.uni_codes, alt_n, per_uni=per_uni)
+    others = [_item(*pool[i]) for i in picked]
 
     # Sort, diversify, cutoff
     preferred.sort(key=lambda x: x["probability"], reverse=True)
-    others.sort(key=lambda x: x["probability"], reverse=True)
-
-    per_uni = int(request.args.get("per_uni", 2))
     preferred = _top_per_university(preferred, per_uni=per_uni)
-    others    = _top_per_university(others,    per_uni=per_uni)
-
-    pref_n = int(request.args.get("pref_n", 10))
-    alt_n  = int(request.args.get("alt_n", 10))
 
     return jsonify({
         "preferred": preferred[:pref_n],
-        "alternatives": others[:alt_n],
+        "alternatives": others,
         "total_considered": len(pool)
     })
 
@@ -533,21 +769,15 @@ def root():
 @app.get("/api/kb/majors-full")
 def kb_majors_full():
     """Return all majors with university associations."""
-    def _load():
-        p = pathlib.Path(__file__).resolve().parents[1] / "kb" / "majors.json"
-        if p.exists():
-            with open(p, "r", encoding="utf-8") as f:
-                return json.load(f)
-        return {}
-    
-    majors_kb = _load()
-    unique_majors = sorted({v.get("major", "").strip() for v in majors_kb.values() if v.get("major")})
-    
-    return jsonify({
-        "majors": unique_majors,
-        "details": majors_kb,
-        "count": len(unique_majors)
-    })
+    index = _kb_index(_load_kb_majors(llm))
+    return _kb_response(index.body_majors_full, index)
+
+# Build KB indexes at startup so the first request doesn't pay for them (best-effort:
+# a bad KB must not stop /api/health or /api/chatbot; KB routes retry on first request)
+try:
+    _kb_index(_load_kb_majors(llm))
+except Exception as e:
+    print(f"Error building KB indexes: {e}")
 
 if __name__ == "__main__":
     host = os.getenv("FLASK_HOST", "127.0.0.1")
@@ -98,6 +98,8 @@ class LLMScorer:
         self.model = self.cfg.get("model", "gpt-4o-mini")
         self.temperature = float(self.cfg.get("temperature", 0.0))
         self.max_output_tokens = int(self.cfg.get("max_output_tokens", 400))
+        self.timeout = float(self.cfg.get("timeout", 30))
+        self.max_retries = int(self.cfg.get("max_retries", 2))
 
         kb_maj_path = (ROOT / self.cfg.get("kb_majors_path", "../kb/majors.json")).resolve()
         kb_dis_path = (ROOT / self.cfg.get("kb_distros_path", "../kb/distros.json")).resolve()
@@ -119,7 +121,8 @@ class LLMScorer:
                 if not api_key:
                     warnings.warn("OPENAI_API_KEY not set; fallback to heuristic")
                 else:
-                    self.client = OpenAI(api_key=api_key)
+                    # Bounded timeout: a slow provider must not pin a server thread for minutes
+                    self.client = OpenAI(api_key=api_key, timeout=self.timeout, max_retries=self.max_retries)
 
     def _percentiles(self, feats: Dict[str, float]) -> Dict[str, float]:
         out = {}
@@ -0,0 +1,11 @@
+# backend/wsgi.py
+"""
+WSGI entry point for production servers, e.g.:
+
+    gunicorn -w 4 -k gthread --threads 16 wsgi:app
+
+Run from the backend folder. `python app.py` still starts the Flask dev server.
+"""
+from app import app
+
+__all__ = ["app"]